@@ -1,16 +1,54 @@
-from fastapi import FastAPI, Response
+from fastapi import FastAPI, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pyscf import gto, mcscf
 import numpy as np
-from typing import Optional
+from typing import Callable, Literal, Optional
 import struct
 import itertools
+import collections
+import functools
 import threading
 import logging
+import hashlib
+import mmap
+import os
+import tempfile
+import asyncio
+from contextlib import asynccontextmanager
+
+try:
+    import numba
+    # Prefer OpenMP: TBB's pool can hang worker shutdown when launched off the main thread
+    numba.config.THREADING_LAYER_PRIORITY = ["omp", "workqueue", "tbb"]
+except ImportError:  # optional – AO evaluation falls back to mol.eval_gto
+    numba = None
+
+try:
+    import zstandard
+except ImportError:  # optional – binary payloads are then always sent uncompressed
+    zstandard = None
+
+try:
+    import cupy
+except ImportError:  # optional – orbital projection stays on the CPU
+    cupy = None
 
 logger = logging.getLogger("uvicorn.error")
 
-app = FastAPI(title="PySCF MCSCF Orbital Visualization API")
+
+@asynccontextmanager
+async def lifespan(app):
+    # Warm every preset before serving so first requests only pay for grid eval
+    await asyncio.get_running_loop().run_in_executor(None, _prewarm)
+    yield
+
+
+app = FastAPI(
+    title="PySCF MCSCF Orbital Visualization API",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -96,49 +134,93 @@ MOLECULE_PRESETS = {
     },
 }
 
-# Cache for MCSCF results keyed by molecule id
+# CASCI (no orbital optimisation) is the default; CASSCF on request
+MCSCFLevel = Literal["casci", "casscf"]
+# Wire format for orbital grids: raw float32, or int16 with a per-orbital scale
+GridEncoding = Literal["float32", "int16"]
+_MCSCF_SOLVERS = {"casci": mcscf.CASCI, "casscf": mcscf.CASSCF}
+
+# Cache for MCSCF results keyed by (molecule id, level)
 _cached_mcscf: dict = {}
 _cache_lock = threading.Lock()
 
 
-def _compute_molecule(molecule_id: str) -> dict:
-    """Run the MCSCF computation for a molecule (no caching logic)."""
+def _compute_molecule(molecule_id: str, level: str = "casci") -> dict:
+    """Run the MCSCF computation for a molecule (no caching logic).
+
+    The molecule, RHF reference and AO cache are shared with any level
+    already computed for the same molecule.
+    """
     preset = MOLECULE_PRESETS.get(molecule_id)
     if preset is None:
         raise ValueError(f"Unknown molecule: {molecule_id}")
+    solver = _MCSCF_SOLVERS.get(level)
+    if solver is None:
+        raise ValueError(f"Unknown MCSCF level: {level}")
 
-    logger.info(f"Computing MCSCF for {molecule_id}...")
-    mol = gto.M(atom=preset["atom"], basis=preset["basis"], verbose=0)
-    mf = mol.RHF().run()
-    mc = mcscf.CASSCF(mf, preset["ncas"], preset["nelecas"]).run()
+    logger.info(f"Computing {level.upper()} for {molecule_id}...")
+    shared = _cached_record(molecule_id)
+    if shared is not None:
+        mol, mf = shared["mol"], shared["mf"]
+    else:
+        mol = gto.M(atom=preset["atom"], basis=preset["basis"], verbose=0)
+        mf = mol.RHF().run()
+    mc = solver(mf, preset["ncas"], preset["nelecas"]).run()
     natorb_coeff, ci, natorb_occ = mcscf.casci.cas_natorb(mc)
-    logger.info(f"MCSCF for {molecule_id} done (E={mc.e_tot:.6f})")
+    logger.info(f"{level.upper()} for {molecule_id} done (E={mc.e_tot:.6f})")
     return {
         "mol": mol,
         "mf": mf,
         "mc": mc,
+        "level": level,
         "natorbs": natorb_coeff,
         "occupations": natorb_occ,
         "energy": float(mc.e_tot),
         "rhf_energy": float(mf.e_tot),
         "preset": preset,
+        # JSON-ready atom list for /api/molecule/info
+        "atoms_serialized": (
+            shared["atoms_serialized"] if shared is not None
+            else [
+                {"element": atom[0], "coords": atom[1].tolist() if hasattr(atom[1], 'tolist') else list(atom[1])}
+                for atom in mol._atom
+            ]
+        ),
     }
 
 
-def get_mcscf_results(molecule_id: str = "water"):
-    """Get cached MCSCF results for a given molecule preset."""
-    if molecule_id in _cached_mcscf:
-        return _cached_mcscf[molecule_id]
+def _cached_record(molecule_id: str) -> Optional[dict]:
+    """Return an already-computed record of any level for the molecule, if any."""
+    # list() – another thread may be inserting a level concurrently
+    return next(
+        (r for (mid, _), r in list(_cached_mcscf.items()) if mid == molecule_id), None
+    )
+
+
+def _molecule_record(molecule_id: str) -> dict:
+    """Record for level-independent data (``mol``, ``atoms_serialized``).
+
+    Reuses whichever level is cached so a cold ``level=casscf`` request does
+    not also run CASCI just for the geometry and basis.
+    """
+    return _cached_record(molecule_id) or get_mcscf_results(molecule_id)
+
+
+def get_mcscf_results(molecule_id: str = "water", level: str = "casci"):
+    """Get cached MCSCF results for a given molecule preset and level."""
+    key = (molecule_id, level)
+    if key in _cached_mcscf:
+        return _cached_mcscf[key]
     with _cache_lock:
         # Double-check after acquiring lock
-        if molecule_id not in _cached_mcscf:
-            _cached_mcscf[molecule_id] = _compute_molecule(molecule_id)
-    return _cached_mcscf[molecule_id]
+        if key not in _cached_mcscf:
+            _cached_mcscf[key] = _compute_molecule(molecule_id, level)
+    return _cached_mcscf[key]
 
 
 # Precompute the default molecule at import time so workers are ready
 logger.info("Precomputing default molecule (water)...")
-_cached_mcscf["water"] = _compute_molecule("water")
+_cached_mcscf[("water", "casci")] = _compute_molecule("water")
 logger.info("Precompute done – worker ready.")
 
 
@@ -150,11 +232,433 @@ def get_grid_bounds(mol, margin_angstrom=5.0):
     return min_coords, max_coords
 
 
-def evaluate_orbital_on_grid(mol, mo_coeff, grid_points):
-    """Evaluate molecular orbital on grid using mol.eval_gto"""
-    ao_value = mol.eval_gto('GTOval_sph', grid_points)
-    mo_value = np.dot(ao_value, mo_coeff)
-    return mo_value
+def _grid_bounds(molecule_id: str, margin: float):
+    """Read-only ``(min_coords, max_coords)`` of a molecule's evaluation grid."""
+    min_coords, max_coords = get_grid_bounds(_molecule_record(molecule_id)["mol"], margin)
+    min_coords.flags.writeable = False
+    max_coords.flags.writeable = False
+    return min_coords, max_coords
+
+
+# Only AO cache misses need the full grid (responses just use _grid_bounds),
+# so a few entries suffice – each is grid_size**3 * 24 bytes
+@functools.lru_cache(maxsize=4)
+def _build_grid(molecule_id: str, grid_size: int, margin: float):
+    """Build (and cache) the flattened evaluation grid for a molecule.
+
+    Returns ``(grid_points, min_coords, max_coords)`` where ``grid_points`` is
+    a read-only, C-contiguous ``(grid_size**3, 3)`` float64 array in 'ij' order.
+    """
+    min_coords, max_coords = _grid_bounds(molecule_id, margin)
+
+    x = np.linspace(min_coords[0], max_coords[0], grid_size)
+    y = np.linspace(min_coords[1], max_coords[1], grid_size)
+    z = np.linspace(min_coords[2], max_coords[2], grid_size)
+
+    # Fill the interleaved (N³, 3) buffer column by column ('ij' order: z fastest)
+    n = grid_size
+    grid_points = np.empty((n ** 3, 3), dtype=np.float64)
+    grid_points[:, 0] = np.repeat(x, n * n)
+    grid_points[:, 1] = np.tile(np.repeat(y, n), n)
+    grid_points[:, 2] = np.tile(z, n * n)
+    # Shared across requests – guard against accidental in-place edits
+    grid_points.flags.writeable = False
+    return grid_points, min_coords, max_coords
+
+
+# Grid points per eval_gto call; bounds the float64 scratch buffer PySCF allocates
+AO_TILE_SIZE = 4096
+# (grid_size, margin) AO grids warmed at startup – the orbital/batch endpoint defaults
+PREWARM_GRIDS = ((64, 5.0), (48, 5.0))
+# Cached AO grids kept per molecule (each is Npts x nao float32): every prewarmed
+# grid plus one more, so picking another resolution doesn't evict a default
+AO_CACHE_MAX_GRIDS = len(PREWARM_GRIDS) + 1
+# Process-wide budget for cached AO grids; least recently used grids go first
+AO_CACHE_MAX_BYTES = 2 << 30
+# AO grids larger than this are evaluated per request and never cached
+AO_CACHE_MAX_ENTRY_BYTES = 256 << 20
+# Upper bound on the grid_size query parameter (the viewers offer up to 96)
+MAX_GRID_SIZE = 128
+
+# (molecule_id, grid_size, margin) -> float32 AO values, see get_ao_values
+_ao_cache: collections.OrderedDict = collections.OrderedDict()
+_ao_cache_lock = threading.Lock()
+
+
+def _eval_ao_tiled(mol, grid_points, tile=AO_TILE_SIZE, rcut2=None):
+    """Evaluate all AOs on the grid tile-by-tile into a ``(Npts, nao)`` float32 array.
+
+    With ``rcut2`` (see ``_shell_cutoffs``) each tile only evaluates the span of
+    shells whose cutoff sphere reaches the tile's bounding box; other AOs are zero.
+    """
+    n_points = grid_points.shape[0]
+    out = np.empty((n_points, mol.nao_nr()), dtype=np.float32)
+    if rcut2 is not None:
+        centers = np.array([mol.bas_coord(ib) for ib in range(mol.nbas)])
+        ao_loc = mol.ao_loc_nr()
+    for s in range(0, n_points, tile):
+        block = grid_points[s:s + tile]
+        if rcut2 is None:
+            out[s:s + tile] = mol.eval_gto('GTOval_sph', block)
+            continue
+        # Squared distance from each shell centre to the tile's bounding box
+        gap = np.maximum(np.maximum(block.min(axis=0) - centers, centers - block.max(axis=0)), 0.0)
+        near = np.flatnonzero(np.einsum('ij,ij->i', gap, gap) < rcut2)
+        if near.size == 0:
+            out[s:s + tile] = 0.0
+            continue
+        sh0, sh1 = near[0], near[-1] + 1
+        i0, i1 = ao_loc[sh0], ao_loc[sh1]
+        out[s:s + tile, :i0] = 0.0
+        out[s:s + tile, i1:] = 0.0
+        out[s:s + tile, i0:i1] = mol.eval_gto('GTOval_sph', block, shls_slice=(sh0, sh1))
+    return out
+
+
+# AO magnitude below which a shell is treated as zero (grid culling)
+AO_CUTOFF_TOL = 1e-6
+
+
+def _shell_cutoffs(mol, tol=AO_CUTOFF_TOL):
+    """Squared radius (Bohr²) beyond which each shell's AOs stay below ``tol``.
+
+    Bounds |AO| by ``S * r**l * exp(-a_min * r**2)`` with ``S`` the largest sum of
+    |normalised coefficients| over the shell's contractions, and solves
+    ``bound == tol`` past the bound's maximum by fixed-point iteration.
+    """
+    rcut2 = np.empty(mol.nbas)
+    for ib in range(mol.nbas):
+        l = mol.bas_angular(ib)
+        a_min = mol.bas_exp(ib).min()
+        coeffs = mol._libcint_ctr_coeff(ib) * np.sqrt((2 * l + 1) / (4 * np.pi))
+        log_ratio = np.log(max(np.abs(coeffs).sum(axis=0).max(), tol) / tol)
+        r2 = max(log_ratio / a_min, l / (2 * a_min), 1e-12)
+        for _ in range(5):
+            r2 = max((log_ratio + 0.5 * l * np.log(r2)) / a_min, l / (2 * a_min), 1e-12)
+        rcut2[ib] = r2
+    return rcut2
+
+
+# Angular normalisation libcint folds into s and p shells for GTOval_sph
+_SP_ANGULAR_FACTORS = (0.282094791773878143, 0.488602511902919921)
+
+
+def _separable_basis(mol):
+    """Flatten mol's shells into arrays for the numba AO kernel.
+
+    Each contraction becomes its own pseudo-shell with the radial and angular
+    normalisation folded into the primitive coefficients. Returns None if the
+    basis has shells with l >= 2 or is cartesian (use ``mol.eval_gto`` then).
+    """
+    if mol.cart or any(mol.bas_angular(ib) > 1 for ib in range(mol.nbas)):
+        return None
+    ao_loc = mol.ao_loc_nr()
+    rcut2 = _shell_cutoffs(mol)
+    shell_l, shell_ao, shell_prim, shell_rcut2 = [], [], [0], []
+    prim_center, prim_exp, prim_coef = [], [], []
+    for ib in range(mol.nbas):
+        l = mol.bas_angular(ib)
+        exps = mol.bas_exp(ib)
+        coeffs = mol._libcint_ctr_coeff(ib) * _SP_ANGULAR_FACTORS[l]
+        for ictr in range(coeffs.shape[1]):
+            shell_l.append(l)
+            shell_ao.append(ao_loc[ib] + ictr * (2 * l + 1))
+            shell_rcut2.append(rcut2[ib])
+            prim_center.extend([mol.bas_coord(ib)] * len(exps))
+            prim_exp.extend(exps)
+            prim_coef.extend(coeffs[:, ictr])
+            shell_prim.append(len(prim_exp))
+    return {
+        "shell_l": np.array(shell_l, dtype=np.int64),
+        "shell_ao": np.array(shell_ao, dtype=np.int64),
+        "shell_prim": np.array(shell_prim, dtype=np.int64),
+        "shell_rcut2": np.array(shell_rcut2, dtype=np.float64),
+        "prim_center": np.array(prim_center, dtype=np.float64).reshape(-1, 3),
+        "prim_exp": np.array(prim_exp, dtype=np.float64),
+        "prim_coef": np.array(prim_coef, dtype=np.float64),
+        "nao": int(mol.nao_nr()),
+    }
+
+
+if numba is not None:
+    @numba.njit(parallel=True, fastmath=True)
+    def _eval_ao_separable_kernel(x, y, z, shell_l, shell_ao, shell_prim, shell_rcut2,
+                                  prim_center, prim_coef, ex, ey, ez, nao):
+        """Evaluate s/p AOs on the ``x ⊗ y ⊗ z`` grid ('ij' order).
+
+        ``ex[p, ix]`` etc. hold the per-axis Gaussian factors of primitive p, so
+        each primitive costs two multiplies per grid point. Points beyond a
+        shell's cutoff radius are written as zero without touching its primitives.
+        """
+        nx, ny, nz = x.size, y.size, z.size
+        nprim = prim_coef.size
+        nshell = shell_l.size
+        out = np.empty((nx * ny * nz, nao), dtype=np.float32)
+        for ix in numba.prange(nx):
+            exy = np.empty(nprim)
+            dxy2 = np.empty(nshell)
+            for iy in range(ny):
+                for p in range(nprim):
+                    exy[p] = prim_coef[p] * ex[p, ix] * ey[p, iy]
+                for sh in range(nshell):
+                    p0 = shell_prim[sh]
+                    dxy2[sh] = ((x[ix] - prim_center[p0, 0]) ** 2
+                                + (y[iy] - prim_center[p0, 1]) ** 2)
+                for iz in range(nz):
+                    row = (ix * ny + iy) * nz + iz
+                    for sh in range(nshell):
+                        p0 = shell_prim[sh]
+                        a = shell_ao[sh]
+                        if dxy2[sh] + (z[iz] - prim_center[p0, 2]) ** 2 > shell_rcut2[sh]:
+                            for k in range(2 * shell_l[sh] + 1):
+                                out[row, a + k] = 0.0
+                            continue
+                        radial = 0.0
+                        for p in range(p0, shell_prim[sh + 1]):
+                            radial += exy[p] * ez[iz, p]
+                        if shell_l[sh] == 0:
+                            out[row, a] = radial
+                        else:
+                            out[row, a] = radial * (x[ix] - prim_center[p0, 0])
+                            out[row, a + 1] = radial * (y[iy] - prim_center[p0, 1])
+                            out[row, a + 2] = radial * (z[iz] - prim_center[p0, 2])
+        return out
+
+
+def _eval_ao_separable(basis, grid_points, grid_size):
+    """Evaluate AOs with the numba kernel on a cached ``_build_grid`` grid."""
+    n = grid_size
+    x = np.ascontiguousarray(grid_points[::n * n, 0])
+    y = np.ascontiguousarray(grid_points[:n * n:n, 1])
+    z = np.ascontiguousarray(grid_points[:n, 2])
+    center = basis["prim_center"]
+    exp = basis["prim_exp"][:, None]
+    ex = np.exp(-exp * (x[None, :] - center[:, 0:1]) ** 2)
+    ey = np.exp(-exp * (y[None, :] - center[:, 1:2]) ** 2)
+    ez = np.ascontiguousarray(np.exp(-exp * (z[None, :] - center[:, 2:3]) ** 2).T)
+    return _eval_ao_separable_kernel(
+        x, y, z, basis["shell_l"], basis["shell_ao"], basis["shell_prim"],
+        basis["shell_rcut2"], center, basis["prim_coef"], ex, ey, ez, basis["nao"],
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _gpu_stream():
+    """Return a non-blocking CUDA stream, or None without a usable GPU.
+
+    Probed lazily so CUDA is never initialised in the gunicorn master before fork.
+    """
+    if cupy is None:
+        return None
+    try:
+        if cupy.cuda.runtime.getDeviceCount() == 0:
+            return None
+        stream = cupy.cuda.Stream(non_blocking=True)
+        # Cross-check one small projection against NumPy before trusting the device
+        rng = np.random.default_rng(0)
+        ao = rng.standard_normal((512, 16), dtype=np.float32)
+        mo = rng.standard_normal((16, 4))
+        with stream:
+            ao_dev = cupy.asarray(ao)
+        if not np.allclose(_project_on_gpu(ao_dev, mo, stream),
+                           np.dot(mo.astype(np.float32).T, ao.T), rtol=1e-4, atol=1e-5):
+            logger.warning("GPU projection disagrees with NumPy – projecting orbitals on the CPU")
+            return None
+    except Exception:
+        # Broken CUDA installs (driver/toolkit mismatch, missing libs) fail in many ways
+        logger.warning("CUDA probe failed – projecting orbitals on the CPU", exc_info=True)
+        return None
+    logger.info("CUDA device found – AO grids will be kept on the GPU")
+    return stream
+
+
+def _evict_ao_cache(molecule_id: str):
+    """Drop least recently used AO grids beyond the per-molecule and byte caps.
+
+    Call with ``_ao_cache_lock`` held.
+    """
+    keys = [k for k in _ao_cache if k[0] == molecule_id]
+    for k in keys[:max(len(keys) - AO_CACHE_MAX_GRIDS, 0)]:
+        del _ao_cache[k]
+    total = sum(a.nbytes for a in _ao_cache.values())
+    while total > AO_CACHE_MAX_BYTES:
+        _, evicted = _ao_cache.popitem(last=False)
+        total -= evicted.nbytes
+
+
+def _project_on_gpu(ao_values, mo_coeff, stream):
+    """cuBLAS ``mo_coeff.T @ ao_values.T`` on ``stream``, returned as a NumPy array."""
+    with stream:
+        mo_dev = cupy.asarray(mo_coeff, dtype=cupy.float32)
+        out = cupy.asnumpy(cupy.dot(mo_dev.T, ao_values.T), stream=stream)
+    # asnumpy(stream=...) only blocks by default from CuPy 13 on – wait explicitly
+    stream.synchronize()
+    return out
+
+
+def get_ao_values(molecule_id: str, grid_size: int, margin: float):
+    """Get cached float32 AO values on the grid for a molecule preset.
+
+    AO values do not depend on the orbital (or MCSCF level), so they are computed
+    once per (molecule, grid_size, margin) and kept in the process-wide LRU
+    ``_ao_cache``, bounded by ``AO_CACHE_MAX_GRIDS`` per molecule and
+    ``AO_CACHE_MAX_BYTES`` overall; grids above ``AO_CACHE_MAX_ENTRY_BYTES`` are
+    not cached. With a CUDA device the array is a device-resident ``cupy.ndarray``.
+    """
+    key = (molecule_id, grid_size, margin)
+    with _ao_cache_lock:
+        ao_values = _ao_cache.get(key)
+        if ao_values is not None:
+            _ao_cache.move_to_end(key)
+            return ao_values
+
+    results = _molecule_record(molecule_id)
+    grid_points, _, _ = _build_grid(molecule_id, grid_size, margin)
+    basis = _separable_basis(results["mol"]) if numba is not None else None
+    if basis is not None:
+        ao_values = _eval_ao_separable(basis, grid_points, grid_size)
+    else:
+        # Tiles beyond every shell's cutoff stay zero without calling eval_gto
+        ao_values = _eval_ao_tiled(
+            results["mol"], grid_points, rcut2=_shell_cutoffs(results["mol"])
+        )
+    ao_values.flags.writeable = False
+    stream = _gpu_stream()
+    if stream is not None:
+        with stream:
+            ao_values = cupy.asarray(ao_values)
+        stream.synchronize()
+    if ao_values.nbytes <= AO_CACHE_MAX_ENTRY_BYTES:
+        with _ao_cache_lock:
+            _ao_cache[key] = ao_values
+            _evict_ao_cache(molecule_id)
+    return ao_values
+
+
+def evaluate_orbital_on_grid(ao_values, mo_coeff):
+    """Project cached AO values onto molecular orbital(s).
+
+    ``mo_coeff`` may be a single ``(nao,)`` vector or a ``(nao, K)`` block.
+    Returns float32 values, orbital-major – ``(Npts,)`` or ``(K, Npts)`` – so
+    ``.tobytes()`` is the wire payload. Device-resident AOs are projected with
+    cuBLAS; only the MO coefficients go up and the result comes back.
+    """
+    if cupy is not None and isinstance(ao_values, cupy.ndarray):
+        return _project_on_gpu(ao_values, mo_coeff, _gpu_stream())
+    mo_f32 = np.asarray(mo_coeff, dtype=np.float32)
+    return np.dot(mo_f32.T, ao_values.T)
+
+
+def quantize_int16(orbital_float32):
+    """Quantise orbital-major float32 values to int16 with one scale per orbital.
+
+    Returns ``(q, scales)`` with ``value ≈ q * scale`` (symmetric, zero offset).
+    """
+    absmax = np.abs(orbital_float32).max(axis=-1)
+    scales = np.where(absmax > 0, absmax / 32767.0, 1.0).astype(np.float32)
+    q = np.rint(orbital_float32 / scales[..., None])
+    return np.clip(q, -32767, 32767).astype(np.int16), scales
+
+
+# On-disk orbital cache; grids at least this large are mmap'd instead of held in RAM
+# Defaults to a private (0700) directory: file names are predictable, so a shared
+# temp dir would let other local users plant grids. Created before gunicorn forks,
+# so all workers share it.
+ORBITAL_CACHE_DIR = os.environ.get("ORBITAL_CACHE_DIR") or tempfile.mkdtemp(prefix="orbitalviz-")
+os.makedirs(ORBITAL_CACHE_DIR, mode=0o700, exist_ok=True)
+ORBITAL_MMAP_MIN_BYTES = 1 << 20
+# Part of every on-disk cache key – bump when AO evaluation numerics change
+ORBITAL_CACHE_VERSION = 1
+
+
+def _compute_orbital(molecule_id: str, level: str, orbital_index: int, grid_size: int,
+                     margin: float):
+    results = get_mcscf_results(molecule_id, level)
+    ao_values = get_ao_values(molecule_id, grid_size, margin)
+    orbital_float32 = evaluate_orbital_on_grid(ao_values, results["natorbs"][:, orbital_index])
+    orbital_float32.flags.writeable = False
+    return orbital_float32
+
+
+@functools.lru_cache(maxsize=128)
+def _orbital_bytes_in_memory(molecule_id: str, level: str, orbital_index: int,
+                             grid_size: int, margin: float):
+    """Byte ``memoryview`` over a computed grid (no ``tobytes`` copy)."""
+    return memoryview(
+        _compute_orbital(molecule_id, level, orbital_index, grid_size, margin)
+    ).cast('B')
+
+
+@functools.lru_cache(maxsize=128)
+def _orbital_bytes_on_disk(molecule_id: str, level: str, orbital_index: int,
+                           grid_size: int, margin: float):
+    """Read-only ``mmap`` of a grid persisted in ``ORBITAL_CACHE_DIR``.
+
+    The file name hashes everything the values depend on (preset geometry,
+    basis and active space, plus ``ORBITAL_CACHE_VERSION``), so a shared or
+    persistent cache directory never serves grids from an older setup.
+    """
+    preset = MOLECULE_PRESETS[molecule_id]
+    key = hashlib.blake2b(
+        repr((
+            ORBITAL_CACHE_VERSION, molecule_id, preset["atom"], preset["basis"],
+            preset["ncas"], preset["nelecas"], level, orbital_index, grid_size, margin,
+        )).encode(),
+        digest_size=16,
+    ).hexdigest()
+    path = os.path.join(ORBITAL_CACHE_DIR, f"orb_{key}.f32")
+
+    def write():
+        # Write under a private name and rename so other workers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        _compute_orbital(molecule_id, level, orbital_index, grid_size, margin).tofile(tmp_path)
+        os.replace(tmp_path, path)
+
+    if not os.path.exists(path):
+        write()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == grid_size ** 3 * 4:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    logger.warning(f"Replacing orbital cache file of unexpected size: {path}")
+    write()
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _orbital_bytes(molecule_id: str, level: str, orbital_index: int, grid_size: int,
+                   margin: float):
+    """Return the Float32 grid for one orbital as a bytes-like object.
+
+    Small grids are cached in memory. Large grids on one of the ``PREWARM_GRIDS``
+    are written once to ``ORBITAL_CACHE_DIR`` (shared by all workers) and mmap'd;
+    that set is finite, which bounds the directory. Other large grids are
+    computed per request – ``grid_size``/``margin`` come straight from the
+    query string, so persisting them would let clients fill the disk.
+    """
+    args = (molecule_id, level, orbital_index, grid_size, margin)
+    if grid_size ** 3 * 4 < ORBITAL_MMAP_MIN_BYTES:
+        return _orbital_bytes_in_memory(*args)
+    if (grid_size, margin) in PREWARM_GRIDS:
+        return _orbital_bytes_on_disk(*args)
+    return memoryview(_compute_orbital(*args)).cast('B')
+
+
+def _orbital_is_cached(grid_size: int, margin: float) -> bool:
+    """Whether ``_orbital_bytes`` keeps this grid (in memory or on disk)."""
+    return grid_size ** 3 * 4 < ORBITAL_MMAP_MIN_BYTES or (grid_size, margin) in PREWARM_GRIDS
+
+
+def _prewarm():
+    """Compute default-level MCSCF results and AO grids for every preset."""
+    logger.info("Prewarming MCSCF and AO caches...")
+    for molecule_id in MOLECULE_PRESETS:
+        try:
+            get_mcscf_results(molecule_id)
+            for grid_size, margin in PREWARM_GRIDS:
+                get_ao_values(molecule_id, grid_size, margin)
+        except Exception:
+            logger.exception(f"Prewarm failed for {molecule_id}")
+    logger.info("Prewarm done.")
 
 
 def generate_orbital_labels(mol, mo_coeffs, occupations):
@@ -163,46 +667,49 @@ def generate_orbital_labels(mol, mo_coeffs, occupations):
     n_orbitals = mo_coeffs.shape[1]
     labels = []
 
-    # Angular momentum sublabels
-    l_names = {0: 's', 1: 'p', 2: 'd', 3: 'f'}
+    # Map every AO to its atom label and (atom_label, l, n) shell group once,
+    # keeping groups in first-appearance order so weight ties sort as before
+    element_counts = collections.Counter(a[1] for a in ao_labels)
+    half_natm = mol.natm // 2
+    atom_groups = {}  # atom_label -> group index
+    shell_groups = {}  # (atom_label, l_char, n_quantum) -> group index
+    atom_of_ao = np.empty(len(ao_labels), dtype=np.intp)
+    shell_of_ao = np.empty(len(ao_labels), dtype=np.intp)
+    for j, (atom_idx, element, orb_type, m_label) in enumerate(ao_labels):
+        atom_label = f"{element}{atom_idx+1}" if element_counts[element] > half_natm else element
+
+        # orb_type is like '1s', '2s', '2p', '3d', etc.
+        l_char = orb_type[-1] if orb_type else 's'
+        n_quantum = orb_type[:-1] if len(orb_type) > 1 else ''
+
+        atom_of_ao[j] = atom_groups.setdefault(atom_label, len(atom_groups))
+        shell_of_ao[j] = shell_groups.setdefault(
+            (atom_label, l_char, n_quantum), len(shell_groups)
+        )
+    atom_group_labels = list(atom_groups)
+    shell_keys = list(shell_groups)
+    aos_of_atom = {name: np.flatnonzero(atom_of_ao == g) for name, g in atom_groups.items()}
+
+    # Per-orbital weights grouped by atom and by (atom, l, n) in one pass each
+    weights = mo_coeffs ** 2  # (nao, n_orb)
+    total_weights = np.ascontiguousarray(weights.T).sum(axis=1)
+    per_atom = np.zeros((len(atom_group_labels), n_orbitals))
+    np.add.at(per_atom, atom_of_ao, weights)
+    per_shell = np.zeros((len(shell_keys), n_orbitals))
+    np.add.at(per_shell, shell_of_ao, weights)
 
     for i in range(n_orbitals):
         coeffs = mo_coeffs[:, i]
-        weights = coeffs ** 2
-        total_weight = np.sum(weights)
+        total_weight = total_weights[i]
         if total_weight < 1e-10:
             labels.append(f"MO {i+1}")
             continue
 
-        # Group weights by atom and by angular momentum
-        atom_weights = {}  # atom_label -> total weight
-        atom_l_weights = {}  # (atom_label, l) -> total weight
-        atom_l_details = {}  # (atom_label, l) -> [(m_label, weight), ...]
-
-        for j, (atom_idx, element, orb_type, m_label) in enumerate(ao_labels):
-            w = weights[j]
-            atom_label = f"{element}{atom_idx+1}" if sum(1 for a in ao_labels if a[1] == element) > len(mol.atom_coords()) // 2 else element
-
-            # Determine angular momentum from orbital type string
-            # orb_type is like '1s', '2s', '2p', '3d', etc.
-            l_char = orb_type[-1] if orb_type else 's'
-            l_num = {'s': 0, 'p': 1, 'd': 2, 'f': 3}.get(l_char, 0)
-            n_quantum = orb_type[:-1] if len(orb_type) > 1 else ''
-
-            atom_weights[atom_label] = atom_weights.get(atom_label, 0) + w
-
-            key = (atom_label, l_char, n_quantum)
-            atom_l_weights[key] = atom_l_weights.get(key, 0) + w
-
-            if key not in atom_l_details:
-                atom_l_details[key] = []
-            atom_l_details[key].append((m_label, w))
-
         # Sort atoms by weight
-        sorted_atoms = sorted(atom_weights.items(), key=lambda x: -x[1])
+        sorted_atoms = sorted(zip(atom_group_labels, per_atom[:, i]), key=lambda x: -x[1])
 
         # Sort atom+l contributions by weight
-        sorted_al = sorted(atom_l_weights.items(), key=lambda x: -x[1])
+        sorted_al = sorted(zip(shell_keys, per_shell[:, i]), key=lambda x: -x[1])
 
         # Build label from top contributions
         occ = occupations[i] if i < len(occupations) else 0
@@ -230,12 +737,8 @@ def generate_orbital_labels(mol, mo_coeffs, occupations):
             atom_signs = {}
             for atom_label, _ in major_atoms:
                 # Get the coefficient with the largest magnitude for this atom
-                max_coeff = 0
-                for j, (atom_idx, element, orb_type, m_label) in enumerate(ao_labels):
-                    a_lbl = f"{element}{atom_idx+1}" if sum(1 for a in ao_labels if a[1] == element) > len(mol.atom_coords()) // 2 else element
-                    if a_lbl == atom_label and abs(coeffs[j]) > abs(max_coeff):
-                        max_coeff = coeffs[j]
-                atom_signs[atom_label] = np.sign(max_coeff)
+                atom_coeffs = coeffs[aos_of_atom[atom_label]]
+                atom_signs[atom_label] = np.sign(atom_coeffs[np.argmax(np.abs(atom_coeffs))])
 
             signs = list(atom_signs.values())
             is_antibonding = len(set(signs)) > 1
@@ -254,6 +757,90 @@ def generate_orbital_labels(mol, mo_coeffs, occupations):
     return labels
 
 
+ZSTD_LEVEL = 3
+
+
+def _accepts_zstd(request: Request) -> bool:
+    """Whether Accept-Encoding lists ``zstd`` with a non-zero q-value."""
+    for entry in request.headers.get("accept-encoding", "").split(","):
+        coding, *params = [part.strip() for part in entry.split(";")]
+        if coding.lower() != "zstd":
+            continue
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def _zstd_compress(chunks) -> bytes:
+    """Compress a sequence of byte chunks into one zstd frame."""
+    # Single-threaded: a grid fits in one zstd job, and threads=-1 would spin
+    # up a pool of node-count (not pod-limit) workers on every call
+    cobj = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    return b"".join([cobj.compress(chunk) for chunk in chunks] + [cobj.flush()])
+
+
+def _binary_response(request: Request, chunks, headers: Optional[dict] = None,
+                     zstd_body: Optional[Callable[[], bytes]] = None):
+    """Build the octet-stream response for a sequence of byte chunks.
+
+    Clients advertising ``zstd`` in Accept-Encoding get the whole body
+    zstd-compressed with ``Content-Encoding: zstd`` (browsers decode it
+    transparently, so the payload layout is unchanged); everything else streams
+    the chunks uncompressed. The zstd body is built in full before sending, so
+    only uncompressed responses are streamed. ``zstd_body`` returns an already
+    compressed (cached) body to send instead of compressing ``chunks`` again;
+    ``chunks`` may be a callable so they are only built when actually needed.
+    """
+    headers = {**(headers or {}), "Vary": "Accept-Encoding"}
+    if zstandard is not None and _accepts_zstd(request):
+        if zstd_body is not None:
+            body = zstd_body()
+        else:
+            body = _zstd_compress(chunks() if callable(chunks) else chunks)
+        headers["Content-Encoding"] = "zstd"
+        return Response(content=body, media_type="application/octet-stream", headers=headers)
+    if callable(chunks):
+        chunks = chunks()
+    headers["Content-Length"] = str(sum(memoryview(chunk).nbytes for chunk in chunks))
+    return StreamingResponse(iter(chunks), media_type="application/octet-stream", headers=headers)
+
+
+def _orbital_chunks(molecule_id: str, level: str, orbital_index: int, grid_size: int,
+                    margin: float, encoding: str):
+    """Header and grid chunks of a single-orbital response (see ``get_orbital_data``)."""
+    min_coords, max_coords = _grid_bounds(molecule_id, margin)
+    binary_data = _orbital_bytes(molecule_id, level, orbital_index, grid_size, margin)
+
+    # Create metadata header (grid dimensions and bounds)
+    header = struct.pack('3i6f',
+                         grid_size, grid_size, grid_size,
+                         min_coords[0], min_coords[1], min_coords[2],
+                         max_coords[0], max_coords[1], max_coords[2])
+
+    if encoding == "int16":
+        q, scale = quantize_int16(np.frombuffer(binary_data, dtype=np.float32))
+        header += struct.pack('2f', scale, 0.0)
+        binary_data = memoryview(q).cast('B')
+
+    # Header then the cached buffer – no concatenated copy of the grid
+    return [header, memoryview(binary_data)]
+
+
+@functools.lru_cache(maxsize=128)
+def _orbital_zstd(molecule_id: str, level: str, orbital_index: int, grid_size: int,
+                  margin: float, encoding: str) -> bytes:
+    """zstd body of a single-orbital response, cached like ``_orbital_bytes``."""
+    return _zstd_compress(
+        _orbital_chunks(molecule_id, level, orbital_index, grid_size, margin, encoding)
+    )
+
+
 @app.get("/healthz")
 async def healthz():
     return {"status": "ok"}
@@ -275,17 +862,22 @@ async def list_molecules():
 
 @app.get("/api/orbital/{orbital_index}")
 async def get_orbital_data(
+    request: Request,
     orbital_index: int = 0,
-    grid_size: int = 64,
+    grid_size: int = Query(64, ge=1, le=MAX_GRID_SIZE),
     margin: float = 5.0,
     isovalue: Optional[float] = None,
     molecule: str = "water",
+    level: MCSCFLevel = "casci",
+    encoding: GridEncoding = "float32",
 ):
     """
     Get orbital data as Float32 binary buffer
+
+    With ``encoding=int16`` the header is followed by ``2f`` (scale, offset)
+    and the grid is sent as int16; values are ``q * scale + offset``.
     """
-    results = get_mcscf_results(molecule)
-    mol = results["mol"]
+    results = get_mcscf_results(molecule, level)
     natorbs = results["natorbs"]
     
     if orbital_index >= natorbs.shape[1]:
@@ -294,70 +886,53 @@ async def get_orbital_data(
             status_code=400
         )
     
-    # Calculate grid bounds
-    min_coords, max_coords = get_grid_bounds(mol, margin)
-    
-    # Create 3D grid
-    x = np.linspace(min_coords[0], max_coords[0], grid_size)
-    y = np.linspace(min_coords[1], max_coords[1], grid_size)
-    z = np.linspace(min_coords[2], max_coords[2], grid_size)
-    
-    xx, yy, zz = np.meshgrid(x, y, z, indexing='ij')
-    grid_points = np.column_stack([xx.ravel(), yy.ravel(), zz.ravel()])
-    
-    # Evaluate orbital on grid
-    mo_coeff = natorbs[:, orbital_index]
-    orbital_values = evaluate_orbital_on_grid(mol, mo_coeff, grid_points)
-    orbital_grid = orbital_values.reshape(grid_size, grid_size, grid_size)
-    
-    # Convert to Float32 and create binary buffer
-    orbital_float32 = orbital_grid.astype(np.float32)
-    binary_data = orbital_float32.tobytes()
-    
-    # Create metadata header (grid dimensions and bounds)
-    header = struct.pack('3i6f', 
-                        grid_size, grid_size, grid_size,
-                        min_coords[0], min_coords[1], min_coords[2],
-                        max_coords[0], max_coords[1], max_coords[2])
-    
-    return Response(
-        content=header + binary_data,
-        media_type="application/octet-stream",
+    # Cached 3D grid bounds and orbital values
+    min_coords, max_coords = _grid_bounds(molecule, margin)
+    args = (molecule, level, orbital_index, grid_size, margin, encoding)
+    return _binary_response(
+        request,
+        # Built lazily: a cached zstd body skips the int16 quantization entirely
+        lambda: _orbital_chunks(*args),
         headers={
             "X-Grid-Size": str(grid_size),
             "X-Min-Coords": f"{min_coords[0]},{min_coords[1]},{min_coords[2]}",
             "X-Max-Coords": f"{max_coords[0]},{max_coords[1]},{max_coords[2]}"
-        }
+        },
+        # Only memoize compression where the raw grid is cached too
+        zstd_body=(lambda: _orbital_zstd(*args)) if _orbital_is_cached(grid_size, margin) else None,
     )
 
 
 @app.get("/api/molecule/info")
-async def get_molecule_info(molecule: str = "water"):
-    """Get information about the molecule."""
-    results = get_mcscf_results(molecule)
+async def get_molecule_info(molecule: str = "water", level: MCSCFLevel = "casci"):
+    """Get information about the molecule.
+
+    ``level`` selects CASCI (default, no orbital optimisation) or CASSCF natural
+    orbitals; pass the same level to the orbital endpoints.
+    """
+    results = get_mcscf_results(molecule, level)
     mol = results["mol"]
     
     orbital_labels = generate_orbital_labels(
         mol, results["natorbs"], results["occupations"]
     )
 
-    return {
-        "atoms": [
-            {"element": atom[0], "coords": atom[1].tolist() if hasattr(atom[1], 'tolist') else list(atom[1])}
-            for atom in mol._atom
-        ],
+    # Returned as a response directly so FastAPI skips its jsonable_encoder pass
+    return ORJSONResponse({
+        "atoms": results["atoms_serialized"],
         "num_orbitals": results["natorbs"].shape[1],
         "basis": mol.basis,
         "occupations": results["occupations"].tolist(),
         "orbital_labels": orbital_labels,
         "energy": results["energy"],
-    }
+        "level": level,
+    })
 
 
 @app.get("/api/molecule/details")
-async def get_molecule_details(molecule: str = "water"):
-    """Get comprehensive details about the molecule, basis set, and CASSCF calculation."""
-    results = get_mcscf_results(molecule)
+async def get_molecule_details(molecule: str = "water", level: MCSCFLevel = "casci"):
+    """Get comprehensive details about the molecule, basis set, and CASCI/CASSCF calculation."""
+    results = get_mcscf_results(molecule, level)
     mol = results["mol"]
     mc = results["mc"]
     mf = results["mf"]
@@ -447,8 +1022,9 @@ async def get_molecule_details(molecule: str = "water"):
         "correlation_energy": round(float(results["energy"]) - float(results["rhf_energy"]), 10),
     }
 
-    # ── CASSCF details ──
+    # ── CASSCF details (keys kept for CASCI too) ──
     casscf_info = {
+        "method": level.upper(),
         "ncas": preset["ncas"],
         "nelecas": preset["nelecas"],
         "active_space_label": f"CAS({preset['nelecas']},{preset['ncas']})",
@@ -502,54 +1078,69 @@ async def get_molecule_details(molecule: str = "water"):
 
 @app.get("/api/orbitals/batch")
 async def get_orbital_batch(
+    request: Request,
     indices: str = "0,1,2,3",
-    grid_size: int = 48,
+    grid_size: int = Query(48, ge=1, le=MAX_GRID_SIZE),
     margin: float = 5.0,
     molecule: str = "water",
+    level: MCSCFLevel = "casci",
+    encoding: GridEncoding = "float32",
 ):
     """
     Get multiple orbitals in one request as concatenated binary data.
+
+    With ``encoding=int16`` the header is followed by one float32 scale per
+    orbital and each grid is sent as int16 (``value = q * scale``).
     """
-    results = get_mcscf_results(molecule)
-    mol = results["mol"]
+    results = get_mcscf_results(molecule, level)
     natorbs = results["natorbs"]
     
-    orbital_indices = [int(i.strip()) for i in indices.split(",")]
+    # Parsed in one pass by NumPy (same int() rules, surrounding whitespace allowed)
+    try:
+        orbital_indices = np.array(indices.split(","), dtype=np.intp)
+    except ValueError:
+        return Response(
+            content=f"Invalid orbital indices {indices!r} (expected integers in 0-{natorbs.shape[1]-1})",
+            status_code=400
+        )
+    except OverflowError:
+        # Too large for intp, so certainly out of range – report it like any other
+        orbital_indices = None
     
     # Validate indices
-    for idx in orbital_indices:
-        if idx < 0 or idx >= natorbs.shape[1]:
-            return Response(
-                content=f"Orbital index {idx} out of range (0-{natorbs.shape[1]-1})",
-                status_code=400
-            )
-    
-    min_coords, max_coords = get_grid_bounds(mol, margin)
+    if orbital_indices is None:
+        idx = next(i for i in map(int, indices.split(",")) if not 0 <= i < natorbs.shape[1])
+    else:
+        out_of_range = (orbital_indices < 0) | (orbital_indices >= natorbs.shape[1])
+        idx = orbital_indices[out_of_range][0] if out_of_range.any() else None
+    if idx is not None:
+        return Response(
+            content=f"Orbital index {idx} out of range (0-{natorbs.shape[1]-1})",
+            status_code=400
+        )
     
-    x = np.linspace(min_coords[0], max_coords[0], grid_size)
-    y = np.linspace(min_coords[1], max_coords[1], grid_size)
-    z = np.linspace(min_coords[2], max_coords[2], grid_size)
-    xx, yy, zz = np.meshgrid(x, y, z, indexing='ij')
-    grid_points = np.column_stack([xx.ravel(), yy.ravel(), zz.ravel()])
+    min_coords, max_coords = _grid_bounds(molecule, margin)
     
     num_orbs = len(orbital_indices)
     # Header: num_orbitals, gx, gy, gz, minX, minY, minZ, maxX, maxY, maxZ, indices...
     header = struct.pack(
         f'<{4 + num_orbs}i6f',
         num_orbs, grid_size, grid_size, grid_size,
-        *orbital_indices,
+        *orbital_indices.tolist(),
         float(min_coords[0]), float(min_coords[1]), float(min_coords[2]),
         float(max_coords[0]), float(max_coords[1]), float(max_coords[2]),
     )
     
-    all_data = bytearray(header)
-    for idx in orbital_indices:
-        mo_coeff = natorbs[:, idx]
-        orbital_values = evaluate_orbital_on_grid(mol, mo_coeff, grid_points)
-        orbital_grid = orbital_values.reshape(grid_size, grid_size, grid_size)
-        all_data.extend(orbital_grid.astype(np.float32).tobytes())
+    # Project the cached AOs onto all requested MOs in a single GEMM
+    ao_values = get_ao_values(molecule, grid_size, margin)
+    mo_block = natorbs[:, orbital_indices]  # (nao, K)
+    # (K, Npts) float32: each orbital's grid is contiguous, in request order
+    orbital_float32 = evaluate_orbital_on_grid(ao_values, mo_block)
     
-    return Response(
-        content=bytes(all_data),
-        media_type="application/octet-stream"
-    )
+    payload = orbital_float32
+    if encoding == "int16":
+        payload, scales = quantize_int16(orbital_float32)
+        header += struct.pack(f'<{num_orbs}f', *scales)
+    
+    chunks = [header] + [memoryview(orbital).cast('B') for orbital in payload]
+    return _binary_response(request, chunks)